@@ -4,31 +4,52 @@ FFXIV Character Management Discord Bot
 Main entry point for bot initialization and execution.
 """
 import os
+import atexit
+import contextlib
+import queue
+import pkgutil
 import logging
 import asyncio
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Optional, Tuple
+from dotenv import load_dotenv, dotenv_values
 
 from interactions import (
     Client, 
     Intents, 
     listen,
     slash_command,
-    SlashContext,
-    Embed
+    SlashContext
 )
 
+from database import close_db
+
 # Load environment variables from .env file if present
 load_dotenv()
 
-# Setup logging
+# Setup logging: records are queued on the event loop thread and written
+# to the console and log file by a background listener thread
+log_queue = queue.SimpleQueue()
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(log_formatter)
+file_handler = logging.FileHandler("bot.log", encoding="utf-8")
+file_handler.setFormatter(log_formatter)
+
+log_listener = QueueListener(log_queue, stream_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# The queue handler only merges the message and arguments; the listener's
+# handlers apply the full format
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("bot.log", encoding="utf-8")
-    ]
+    handlers=[queue_handler]
 )
 logger = logging.getLogger("ffxiv_bot")
 
@@ -39,16 +60,23 @@ bot = Client(
     test_guilds=[int(os.getenv("TEST_GUILD_ID"))] if os.getenv("TEST_GUILD_ID") else None
 )
 
+# Registered command names, computed on the first ready event and reset
+# whenever the set of loaded extensions changes
+_command_names: Optional[Tuple[str, ...]] = None
+
 @listen()
 async def on_ready():
     """Called when the bot is ready to handle commands."""
-    logger.info(f"{bot.user.username} is ready! Connected to {len(bot.guilds)} guilds")
+    global _command_names
+    
+    logger.info("%s is ready! Connected to %d guilds", bot.user.username, len(bot.guilds))
     
     try:
-        commands = bot.application_commands
-        logger.info(f"Registered commands: {[cmd.name for cmd in commands]}")
-    except Exception as e:
-        logger.error(f"Error fetching commands: {e}")
+        if _command_names is None:
+            _command_names = tuple(cmd.name for cmd in bot.application_commands)
+        logger.info("Registered commands: %s", list(_command_names))
+    except Exception:
+        logger.exception("Error fetching commands")
 
 @slash_command(
     name="ping",
@@ -58,45 +86,105 @@ async def ping(ctx: SlashContext):
     """Simple ping command to check if the bot is responsive."""
     await ctx.send("Pong! Bot is up and running!")
 
-async def load_extensions():
-    """Load all extensions from the cogs directory."""
+LOOKUP_COG_SOURCE = '''"""
+Character lookup cog for the FFXIV Discord bot.
+"""
+from interactions import Client
+from character_lookup import CharacterLookupCog
+
+def setup(client: Client):
+    """Set up the character lookup extension."""
+    cog = CharacterLookupCog(client)
+    
+    # The cog class lives in character_lookup, so tie it to this module so
+    # unloading this extension drops it
+    cog.extension_name = __name__
+'''
+
+def _ensure_bootstrap_files():
+    """
+    Create the generated lookup cog and the .env XIVAPI_KEY entry if needed.
+    
+    Both checks are idempotent, so restarting the bot doesn't rewrite
+    files that are already up to date.
+    """
     # Create the cogs directory if it doesn't exist
     cogs_dir = Path("cogs")
     cogs_dir.mkdir(exist_ok=True)
     
-    # First, check if character_lookup.py exists in the current directory
+    # Generate the lookup cog only if it's missing or out of date
     lookup_file = Path("character_lookup.py")
+    lookup_cog = cogs_dir / "lookup_cog.py"
     if lookup_file.exists():
-        # Create a simple cog file in the cogs directory
-        with open(cogs_dir / "lookup_cog.py", "w") as f:
-            f.write('''"""
-Character lookup cog for the FFXIV Discord bot.
-"""
-from interactions import Extension, Client
-from character_lookup import CharacterLookupCog
+        if not lookup_cog.exists() or lookup_cog.read_text() != LOOKUP_COG_SOURCE:
+            with open(lookup_cog, "w") as f:
+                f.write(LOOKUP_COG_SOURCE)
+            logger.info("Generated %s", lookup_cog)
+    
+    # Add an empty XIVAPI_KEY to .env only if the file doesn't define it yet
+    env_file = Path(".env")
+    if not env_file.exists():
+        with open(env_file, "a") as f:
+            f.write("\nXIVAPI_KEY=")
+        logger.info("Created .env file with empty XIVAPI_KEY")
+    elif "XIVAPI_KEY" not in dotenv_values(env_file):
+        with open(env_file, "a") as f:
+            f.write("\nXIVAPI_KEY=")
+        logger.info("Added empty XIVAPI_KEY to .env file")
 
-async def setup(client: Client) -> Extension:
-    """Set up the character lookup extension."""
-    return CharacterLookupCog(client)
-''')
-    
-    # Then load all extensions from the cogs directory
-    for filepath in cogs_dir.glob("*.py"):
-        filename = filepath.name
-        
-        # Skip files that shouldn't be loaded
-        if filename.startswith("_") or filename == "__init__.py":
-            continue
-        
-        # Extract the extension name 
-        extension_name = f"cogs.{filename[:-3]}"
-        
+# Extensions must be loaded, unloaded and reloaded through these helpers so
+# the cached command names are reset whenever the registered commands change
+
+def load_extension(extension_name: str):
+    """Load an extension and invalidate the cached command names."""
+    global _command_names
+    
+    bot.load_extension(extension_name)
+    _command_names = None
+
+def unload_extension(extension_name: str):
+    """Unload an extension and invalidate the cached command names."""
+    global _command_names
+    
+    bot.unload_extension(extension_name)
+    _command_names = None
+
+def reload_extension(extension_name: str):
+    """Reload an extension and invalidate the cached command names."""
+    global _command_names
+    
+    bot.reload_extension(extension_name)
+    _command_names = None
+
+def load_extensions():
+    """Load all extensions from the cogs directory."""
+    cogs_dir = Path("cogs")
+    
+    # Collect all extension modules and packages from the cogs directory,
+    # skipping private modules
+    extension_names = [
+        f"cogs.{module.name}"
+        for module in pkgutil.iter_modules([str(cogs_dir)])
+        if not module.name.startswith("_")
+    ]
+    
+    # Extensions load synchronously, so load them one at a time and log
+    # failures individually
+    for extension_name in extension_names:
         try:
-            # Load the extension
-            await bot.load_extension(extension_name)
-            logger.info(f"Loaded extension: {extension_name}")
-        except Exception as e:
-            logger.error(f"Failed to load extension {extension_name}: {e}")
+            load_extension(extension_name)
+            logger.info("Loaded extension: %s", extension_name)
+        except Exception:
+            logger.exception("Failed to load extension %s", extension_name)
+
+async def run_bot():
+    """Run the bot until it stops, then close the shared database connection."""
+    try:
+        await bot.astart()
+    finally:
+        # aiosqlite's worker thread isn't a daemon, so an open connection would
+        # keep the process alive after the bot stops
+        await close_db()
 
 if __name__ == "__main__":
     if not os.getenv("DISCORD_TOKEN"):
@@ -105,17 +193,20 @@ if __name__ == "__main__":
     
     logger.info("Starting FFXIV Character Management Bot")
     
-    # Create .env file with empty XIVAPI_KEY if it doesn't exist
-    if not os.path.exists(".env"):
-        with open(".env", "a") as f:
-            f.write("\nXIVAPI_KEY=")
-        logger.info("Created .env file with empty XIVAPI_KEY")
-    elif "XIVAPI_KEY" not in os.environ:
-        with open(".env", "a") as f:
-            f.write("\nXIVAPI_KEY=")
-        logger.info("Added empty XIVAPI_KEY to .env file")
+    # Use uvloop's libuv-backed event loop when available (not supported on Windows)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        pass
+    
+    # Generate missing bootstrap files before the event loop starts
+    _ensure_bootstrap_files()
     
     # Load extensions
-    asyncio.run(load_extensions())
+    load_extensions()
     
-    bot.start()
\ No newline at end of file
+    # uvloop's policy, when set above, applies to this loop too
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(run_bot())
\ No newline at end of file
@@ -1,7 +1,15 @@
 """
 Character lookup commands for the FFXIV Discord bot.
 """
+import asyncio
+import functools
+import json
 import logging
+import os
+import random
+import re
+import time
+from pathlib import Path
 from typing import Optional, Dict, Any, List
 
 from interactions import (
@@ -18,34 +26,373 @@ from interactions import (
     Button,
     ActionRow,
     ComponentContext,
-    component_callback
+    component_callback,
+    listen
 )
+from interactions.client.errors import HTTPException
 
-from xivapi import XIVAPIClient
+from ratelimit import Cooldown
+from xivapi import get_shared_client
 
 # Set up logger
 logger = logging.getLogger("ffxiv_bot")
 
+# On-disk snapshot of the data center and server lists, reused across restarts
+SERVER_CACHE_PATH = Path("cache") / "dc_servers.json"
+SERVER_CACHE_TTL = 24 * 60 * 60
+
+# Seconds to wait before retrying a failed server list refresh
+SERVER_REFRESH_RETRY = 5 * 60
+
+def _load_server_snapshot() -> Optional[Dict[str, Any]]:
+    """
+    Load the data center and server lists saved by a previous run.
+    
+    Returns:
+        Dictionary with "data_centers", "servers" and "saved_at" (the snapshot's
+        mtime) keys, or None if the snapshot is missing, unreadable, malformed
+        or older than SERVER_CACHE_TTL
+    """
+    try:
+        saved_at = SERVER_CACHE_PATH.stat().st_mtime
+        if time.time() - saved_at > SERVER_CACHE_TTL:
+            return None
+        with open(SERVER_CACHE_PATH, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if (not isinstance(snapshot, dict)
+            or not isinstance(snapshot.get("data_centers"), dict)
+            or not isinstance(snapshot.get("servers"), list)):
+        return None
+    
+    return {"data_centers": snapshot["data_centers"], "servers": snapshot["servers"], "saved_at": saved_at}
+
+def _save_server_snapshot(data_centers: Dict[str, List[str]], servers: List[str]):
+    """
+    Save the data center and server lists for the next run.
+    
+    Args:
+        data_centers: Mapping of data centers to their servers
+        servers: List of server names
+    """
+    SERVER_CACHE_PATH.parent.mkdir(exist_ok=True)
+    
+    # Write to a temporary file first so a crash never leaves a partial snapshot
+    temp_path = SERVER_CACHE_PATH.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"data_centers": data_centers, "servers": servers}, f)
+    os.replace(temp_path, SERVER_CACHE_PATH)
+
+# Embed colors
+ERROR_COLOR = 0xe74c3c
+INFO_COLOR = 0x3498db
+
+def _error_embed(title: str, description: str) -> Embed:
+    """
+    Build an embed reporting a problem to the user.
+    
+    Args:
+        title: Embed title
+        description: Explanation of what went wrong
+        
+    Returns:
+        Embed in the error color
+    """
+    return Embed(title=title, description=description, color=ERROR_COLOR)
+
+def _stale_notice(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Build a warning for responses served from the cache during an XIVAPI outage.
+    
+    Args:
+        data: XIVAPI response
+        
+    Returns:
+        Warning text for an embed footer, or None if the response is fresh
+    """
+    if "CacheAge" not in data:
+        return None
+    
+    minutes = int(data["CacheAge"] // 60)
+    return f"⚠ cached {minutes} minutes ago (XIVAPI unreachable)"
+
+# Lodestone profile page for a character, formatted with its Lodestone ID
+LODESTONE_URL = "https://na.finalfantasyxiv.com/lodestone/character/{}/"
+
+def _lodestone_button(lodestone_id: str) -> Button:
+    """
+    Build a link button to a character's Lodestone page.
+    
+    Args:
+        lodestone_id: Character's Lodestone ID
+        
+    Returns:
+        Link button labelled "Open Lodestone"
+    """
+    return Button(style=ButtonStyle.LINK, label="Open Lodestone", url=LODESTONE_URL.format(lodestone_id))
+
+# Jobs grouped by role; anything not listed here is DPS
+TANKS = frozenset({"Paladin", "Warrior", "Dark Knight", "Gunbreaker"})
+HEALERS = frozenset({"White Mage", "Scholar", "Astrologian", "Sage"})
+CRAFTERS = frozenset({"Alchemist", "Armorer", "Blacksmith", "Carpenter", "Culinarian", "Goldsmith", "Leatherworker", "Weaver"})
+GATHERERS = frozenset({"Botanist", "Fisher", "Miner"})
+
+# Embed field name for each job's role, in the order the fields are shown
+ROLE_FIELDS = ("Tanks", "Healers", "DPS", "Crafters", "Gatherers")
+ROLE_OF = {
+    **{job: "Tanks" for job in TANKS},
+    **{job: "Healers" for job in HEALERS},
+    **{job: "Crafters" for job in CRAFTERS},
+    **{job: "Gatherers" for job in GATHERERS},
+}
+
+# Seconds a user has to wait between lookups
+LOOKUP_COOLDOWN = 3
+
+# Maximum number of interactions handled at once; extra ones are turned away
+# immediately rather than queueing until Discord's response window expires
+MAX_CONCURRENT_HANDLERS = 16
+
+def _sample_names(items: List[Dict[str, Any]], count: int = 5) -> List[str]:
+    """
+    Pick the names of up to count random items without copying the whole list.
+    
+    Args:
+        items: Mounts or minions from an XIVAPI character response
+        count: Maximum number of names to return
+        
+    Returns:
+        Names of the sampled items
+    """
+    indices = random.sample(range(len(items)), min(count, len(items)))
+    return [items[i]["Name"] for i in indices]
+
+def _render_search_hit_embed(character: Dict[str, Any]) -> Embed:
+    """
+    Build a summary embed from a character search result.
+    
+    Args:
+        character: Entry from the "Results" list of a character search
+        
+    Returns:
+        Embed with the character's name, server and avatar
+    """
+    embed = Embed(
+        title=character["Name"],
+        description=f"**Server:** {character['Server']}",
+        color=INFO_COLOR
+    )
+    embed.set_thumbnail(url=character["Avatar"])
+    embed.set_footer(text=f"Lodestone ID: {character['ID']}")
+    return embed
+
+def _collection_field(label: str, items: List[Dict[str, Any]]) -> EmbedField:
+    """
+    Build an embed field with a collection's total and a few random entries.
+    
+    Args:
+        label: Collection name, "Mounts" or "Minions"
+        items: The collection's entries from an XIVAPI character response
+        
+    Returns:
+        Inline embed field for the collection
+    """
+    text = f"Total {label}: {len(items)}\n\n"
+    
+    # Get 5 random entries to display
+    sample = _sample_names(items)
+    if sample:
+        text += f"**Sample {label}:**\n" + "\n".join(sample)
+    else:
+        text += f"No {label.lower()} found."
+    
+    return EmbedField(name=label, value=text, inline=True)
+
+# Button custom IDs handled by this cog, in the form "<action>:<lodestone id>"
+COMPONENT_ID_PATTERN = re.compile(r"^(view_character|view_collections):")
+
+# Character names are letters, apostrophes and hyphens, with at most one space
+# between forename and surname (a lone forename still searches)
+CHARACTER_NAME_PATTERN = re.compile(r"^[A-Za-z'-]+( [A-Za-z'-]+)?$")
+
+def handle_errors(action: str, edit: bool = False):
+    """
+    Catch unexpected errors in a handler and report them to the user.
+    
+    Args:
+        action: What the handler was doing, used in the log and error message
+        edit: Whether to edit the original message instead of sending a new one
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, ctx, *args, **kwargs):
+            try:
+                return await func(self, ctx, *args, **kwargs)
+            except HTTPException as e:
+                # The interaction expired before we responded, so there's nothing to reply to
+                if e.code == 10062:
+                    logger.warning("Interaction expired while %s", action)
+                    return
+                error = e
+            except Exception as e:
+                error = e
+            
+            logger.error("Error %s", action, exc_info=error)
+            
+            embed = _error_embed("Error", f"An error occurred while {action}. Please try again later.")
+            
+            if edit:
+                await ctx.edit_origin(embed=embed, components=[])
+            else:
+                await ctx.send(embed=embed)
+        
+        return wrapper
+    return decorator
+
+def reject_when_busy(func):
+    """Turn an interaction away with a "busy" reply when the cog is at its concurrency limit."""
+    @functools.wraps(func)
+    async def wrapper(self, ctx, *args, **kwargs):
+        if self._handler_slots.locked():
+            embed = _error_embed("Bot Busy", "The bot is handling a lot of requests right now. Please try again in a second.")
+            return await ctx.send(embed=embed, ephemeral=True)
+        
+        async with self._handler_slots:
+            return await func(self, ctx, *args, **kwargs)
+    
+    return wrapper
+
 class CharacterLookupCog(Extension):
     """Character lookup commands."""
     
     def __init__(self, client: Client):
         self.client = client
-        self.xivapi = XIVAPIClient()
+        self.xivapi = get_shared_client(client)
         
         # Cache data centers and servers
         self.data_centers = {}
         self.servers = []
+        
+        # When the server lists were last fetched from XIVAPI, as a Unix timestamp
+        self._servers_fetched_at = 0.0
+        
+        # Fire-and-forget tasks, referenced here so they aren't garbage collected mid-run
+        self._background_tasks = set()
+        
+        # Stops one user from flooding XIVAPI with lookups
+        self._lookup_cooldown = Cooldown(LOOKUP_COOLDOWN)
+        
+        # Bounds how many interactions are processed concurrently
+        self._handler_slots = asyncio.Semaphore(MAX_CONCURRENT_HANDLERS)
+        
+        # Button handlers keyed by custom ID action
+        self.component_handlers = {
+            "view_character": self.view_character_callback,
+            "view_collections": self.view_collections_callback,
+        }
+        
+        # Startup fires once per process, so a cog created by a reload has to
+        # load the server lists itself
+        if client._startup:
+            self._start_server_refresh()
     
-    async def initialize(self):
-        """Initialize API client and cache data."""
+    async def initialize(self) -> bool:
+        """
+        Initialize API client and cache data, from the disk snapshot when it's recent.
+        
+        Returns:
+            True if the server lists were loaded
+        """
         await self.xivapi.initialize()
         
-        # Cache data centers and servers
-        self.data_centers = await self.xivapi.get_data_centers()
-        self.servers = await self.xivapi.get_servers()
+        snapshot = _load_server_snapshot()
+        if snapshot is None:
+            return await self.refresh_servers()
+        
+        self.data_centers = snapshot["data_centers"]
+        self.servers = snapshot["servers"]
+        self._servers_fetched_at = snapshot["saved_at"]
+        
+        logger.info("Loaded %d servers in %d data centers from %s",
+                    len(self.servers), len(self.data_centers), SERVER_CACHE_PATH)
+        return True
+    
+    async def refresh_servers(self) -> bool:
+        """
+        Fetch the data center and server lists from XIVAPI and save them to disk.
+        
+        Returns:
+            True if the lists were fetched, False if XIVAPI couldn't be reached
+        """
+        data_centers = await self.xivapi.get_data_centers()
+        servers = await self.xivapi.get_servers()
+        
+        # Keep the lists we have if XIVAPI couldn't be reached
+        if not data_centers or not servers:
+            logger.warning("Couldn't refresh the server lists from XIVAPI")
+            return False
+        
+        self.data_centers = data_centers
+        self.servers = servers
+        self._servers_fetched_at = time.time()
+        
+        try:
+            _save_server_snapshot(data_centers, servers)
+        except OSError as e:
+            logger.warning("Couldn't save the server lists to %s: %s", SERVER_CACHE_PATH, e)
         
-        logger.info(f"Cached {len(self.servers)} servers in {len(self.data_centers)} data centers")
+        logger.info("Cached %d servers in %d data centers", len(self.servers), len(self.data_centers))
+        return True
+    
+    async def _refresh_servers_periodically(self):
+        """Load the server lists, then refresh them once the snapshot's lifetime has passed, forever."""
+        try:
+            loaded = await self.initialize()
+        except Exception:
+            logger.exception("Failed to load the server lists")
+            loaded = False
+        
+        while True:
+            # Retry failures soon; otherwise count from the last fetch, so a
+            # restart doesn't reset a snapshot's lifetime
+            if loaded:
+                delay = self._servers_fetched_at + SERVER_CACHE_TTL - time.time()
+            else:
+                delay = SERVER_REFRESH_RETRY
+            await asyncio.sleep(max(delay, 0))
+            
+            try:
+                loaded = await self.refresh_servers()
+            except Exception:
+                logger.exception("Failed to refresh the server lists")
+                loaded = False
+    
+    def _start_server_refresh(self):
+        """Start loading and periodically refreshing the server lists in the background."""
+        task = asyncio.create_task(self._refresh_servers_periodically())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    @listen()
+    async def on_startup(self):
+        """Load the server lists in the background once the bot has started."""
+        self._start_server_refresh()
+    
+    def drop(self):
+        """Close the API client and stop background tasks when the extension is unloaded."""
+        for task in list(self._background_tasks):
+            task.cancel()
+        
+        # Other cogs sharing the client reopen its session on their next request
+        try:
+            self._close_task = asyncio.get_running_loop().create_task(self.xivapi.close())
+        except RuntimeError:
+            # No running event loop, so there are no open connections to close
+            pass
+        
+        super().drop()
     
     @slash_command(
         name="lookup",
@@ -55,7 +402,9 @@ class CharacterLookupCog(Extension):
         name="name",
         description="Character name",
         required=True,
-        opt_type=OptionType.STRING
+        opt_type=OptionType.STRING,
+        min_length=2,
+        max_length=21  # Forename and surname are at most 20 characters combined
     )
     @slash_option(
         name="server",
@@ -63,88 +412,137 @@ class CharacterLookupCog(Extension):
         required=False,
         opt_type=OptionType.STRING
     )
+    @reject_when_busy
+    @handle_errors("looking up the character")
     async def lookup_character(self, ctx: SlashContext, name: str, server: Optional[str] = None):
         """Look up a character on the Lodestone."""
-        # Defer response while we process
-        await ctx.defer()
+        # Normalize input so equivalent lookups share cache entries
+        name = " ".join(name.split())
+        if server:
+            server = server.strip().title()
         
-        try:
-            # Initialize API if needed
-            if not self.servers:
-                await self.initialize()
-            
-            # Search for the character
-            results = await self.xivapi.search_character(name, server)
-            
-            # Check for errors
-            if "Error" in results:
-                embed = Embed(
-                    title="API Error",
-                    description=f"Error looking up character: {results['Error']}",
-                    color=0xe74c3c
-                )
-                return await ctx.send(embed=embed)
-            
-            # Check if we have results
-            if "Results" not in results or not results["Results"]:
-                embed = Embed(
-                    title="No Results Found",
-                    description=f"No characters found matching '{name}'{f' on {server}' if server else ''}",
-                    color=0xe74c3c
-                )
-                return await ctx.send(embed=embed)
+        # Reject names XIVAPI can never match without spending a request on them
+        if not CHARACTER_NAME_PATTERN.match(name):
+            embed = _error_embed("Invalid Name", "Character names can only contain letters, apostrophes, hyphens and one space.")
+            return await ctx.send(embed=embed, ephemeral=True)
+        
+        # Reject unknown servers without a round trip to XIVAPI, once the
+        # server list has loaded
+        if server and self.servers and server not in self.servers:
+            embed = _error_embed("Unknown Server", f"'{server}' is not a known server.")
+            return await ctx.send(embed=embed, ephemeral=True)
+        
+        # Only start the cooldown once the lookup may reach XIVAPI, so a typo
+        # doesn't use up the user's window
+        retry_after = self._lookup_cooldown.retry_after(ctx.author.id)
+        if retry_after:
+            embed = _error_embed("Slow Down", f"You can look up another character in {retry_after:.1f} seconds.")
+            return await ctx.send(embed=embed, ephemeral=True)
+        
+        # Defer response while we process, unless the search is cached and
+        # we can answer straight away without the extra round trip
+        if not self.xivapi.has_character_search(name, server):
+            await ctx.defer()
+        
+        # Search for the character
+        results = await self.xivapi.search_character(name, server)
+        
+        # Check for errors
+        if "Error" in results:
+            embed = _error_embed("API Error", f"Error looking up character: {results['Error']}")
+            return await ctx.send(embed=embed)
+        
+        # Check if we have results
+        if "Results" not in results or not results["Results"]:
+            embed = _error_embed("No Results Found", f"No characters found matching '{name}'{f' on {server}' if server else ''}")
+            return await ctx.send(embed=embed)
+        
+        # If there's only one result, show what the search returned and load
+        # the full profile only if the user asks for it
+        if len(results["Results"]) == 1:
+            character = results["Results"][0]
             
-            # If there's only one result, show detailed info right away
-            if len(results["Results"]) == 1:
-                character = results["Results"][0]
-                return await self._show_character_details(ctx, character["ID"])
+            embed = _render_search_hit_embed(character)
+            notice = _stale_notice(results)
+            if notice:
+                embed.footer.text += f" • {notice}"
             
-            # Multiple results, show a selection screen
-            embed = Embed(
-                title="Character Search Results",
-                description=f"Found {len(results['Results'])} characters matching '{name}'{f' on {server}' if server else ''}",
-                color=0x3498db
+            components = ActionRow(
+                Button(
+                    style=ButtonStyle.PRIMARY,
+                    label="Load Full Details",
+                    custom_id=f"view_character:{character['ID']}"
+                ),
+                _lodestone_button(character["ID"])
             )
             
-            # Add the first 10 results to the embed
-            for i, character in enumerate(results["Results"][:10]):
-                embed.add_field(
-                    name=f"{i+1}. {character['Name']}",
+            return await ctx.send(embed=embed, components=components)
+        
+        # Multiple results, show a selection screen with the first 10 results
+        embed = Embed(
+            title="Character Search Results",
+            description=f"Found {len(results['Results'])} characters matching '{name}'{f' on {server}' if server else ''}",
+            color=INFO_COLOR,
+            fields=[
+                EmbedField(
+                    name=f"{i}. {character['Name']}",
                     value=f"Server: {character['Server']}\nID: {character['ID']}",
                     inline=True
                 )
-            
-            # Create buttons for selection (up to 5 characters)
-            components = []
-            buttons = []
-            
-            for i, character in enumerate(results["Results"][:5]):  # Limit to first 5
-                buttons.append(
-                    Button(
-                        style=ButtonStyle.PRIMARY,
-                        label=f"{character['Name']} ({character['Server']})"[:25],
-                        custom_id=f"view_character:{character['ID']}"
-                    )
-                )
-                
-                # Create a new row every 3 buttons
-                if (i + 1) % 3 == 0 or i == len(results["Results"][:5]) - 1:
-                    components.append(ActionRow(*buttons))
-                    buttons = []
-            
-            await ctx.send(embed=embed, components=components)
-            
-        except Exception as e:
-            logger.error(f"Error looking up character: {e}")
-            
-            embed = Embed(
-                title="Error",
-                description="An error occurred while looking up the character. Please try again later.",
-                color=0xe74c3c
+                for i, character in enumerate(results["Results"][:10], start=1)
+            ]
+        )
+        
+        notice = _stale_notice(results)
+        if notice:
+            embed.set_footer(text=notice)
+        
+        # Create buttons for selection (up to 5 characters)
+        top_results = results["Results"][:5]
+        
+        # Warm the cache with the characters the user is likely to pick next,
+        # unless XIVAPI is down and the requests would only fail
+        if not notice:
+            self._start_prefetch([character["ID"] for character in top_results])
+        
+        buttons = [
+            Button(
+                style=ButtonStyle.PRIMARY,
+                label=f"{character['Name']} ({character['Server']})"[:25],
+                custom_id=f"view_character:{character['ID']}"
             )
-            
-            await ctx.send(embed=embed)
+            for character in top_results
+        ]
+        
+        # Lay the buttons out 3 to a row
+        components = [ActionRow(*buttons[i:i + 3]) for i in range(0, len(buttons), 3)]
+        
+        await ctx.send(embed=embed, components=components)
+    
+    def _start_prefetch(self, lodestone_ids: List[str]):
+        """
+        Start fetching character details into the cache in the background.
+        
+        Args:
+            lodestone_ids: Lodestone IDs of the characters to fetch
+        """
+        task = asyncio.create_task(self._prefetch_characters(lodestone_ids))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _prefetch_characters(self, lodestone_ids: List[str]):
+        """
+        Fetch character details into the cache ahead of a button press.
+        
+        Args:
+            lodestone_ids: Lodestone IDs of the characters to fetch
+        """
+        await asyncio.gather(
+            *(self.xivapi.get_character(lodestone_id, extended=True) for lodestone_id in lodestone_ids),
+            return_exceptions=True
+        )
     
+    @handle_errors("fetching character details")
     async def _show_character_details(self, ctx: SlashContext, lodestone_id: str):
         """
         Show detailed character information.
@@ -153,272 +551,162 @@ class CharacterLookupCog(Extension):
             ctx: Command context
             lodestone_id: Character's Lodestone ID
         """
-        try:
-            # Get detailed character information
-            character_data = await self.xivapi.get_character(lodestone_id, extended=True)
-            
-            # Check for errors
-            if "Error" in character_data:
-                embed = Embed(
-                    title="API Error",
-                    description=f"Error fetching character details: {character_data['Error']}",
-                    color=0xe74c3c
-                )
-                return await ctx.send(embed=embed)
-            
-            # Create basic embed
-            embed = Embed(
-                title=f"{character_data['Character']['Name']}",
-                description=f"Level {character_data['Character']['ActiveClassJob']['Level']} {character_data['Character']['ActiveClassJob']['UnlockedState']['Name']}",
-                color=0x3498db
-            )
-            
-            # Set thumbnail to character avatar
-            embed.set_thumbnail(url=character_data['Character']['Avatar'])
-            
-            # Basic info
-            basic_info = [
-                f"**Server:** {character_data['Character']['Server']} ({character_data['Character']['DC']})",
-                f"**Race/Clan:** {character_data['Character']['Race']['Name']} {character_data['Character']['Tribe']['Name']}",
-                f"**Gender:** {'♂' if character_data['Character']['Gender'] == 1 else '♀'}"
-            ]
-            
-            # Add title if available
-            if character_data['Character'].get('Title'):
-                basic_info.append(f"**Title:** {character_data['Character']['Title']['Name']}")
-            
-            embed.add_field(
-                name="Character Info",
-                value="\n".join(basic_info),
-                inline=False
-            )
-            
-            # Add Free Company if available
-            if "FreeCompany" in character_data and character_data["FreeCompany"]:
-                fc = character_data["FreeCompany"]
-                embed.add_field(
-                    name="Free Company",
-                    value=f"**{fc['Name']}** «{fc['Tag']}»\n{fc.get('Server', '')}\n{fc.get('Rank', '')} members",
-                    inline=True
-                )
-            
-            # Job levels (if available)
-            if "ClassJobs" in character_data["Character"]:
-                # Group by role
-                tanks = []
-                healers = []
-                dps = []
-                crafters = []
-                gatherers = []
-                
-                for job in character_data["Character"]["ClassJobs"]:
-                    name = job["UnlockedState"]["Name"]
-                    level = job["Level"]
-                    
-                    if level == 0:
-                        continue
-                        
-                    job_text = f"{name}: {level}"
-                    
-                    # Sort into role
-                    if name in ["Paladin", "Warrior", "Dark Knight", "Gunbreaker"]:
-                        tanks.append(job_text)
-                    elif name in ["White Mage", "Scholar", "Astrologian", "Sage"]:
-                        healers.append(job_text)
-                    elif name in ["Alchemist", "Armorer", "Blacksmith", "Carpenter", "Culinarian", "Goldsmith", "Leatherworker", "Weaver"]:
-                        crafters.append(job_text)
-                    elif name in ["Botanist", "Fisher", "Miner"]:
-                        gatherers.append(job_text)
-                    else:
-                        dps.append(job_text)
+        # Get detailed character information
+        character_data = await self.xivapi.get_character(lodestone_id, extended=True)
+        
+        # Check for errors
+        if "Error" in character_data:
+            embed = _error_embed("API Error", f"Error fetching character details: {character_data['Error']}")
+            return await ctx.send(embed=embed)
+        
+        character = character_data["Character"]
+        active_job = character["ActiveClassJob"]
+        
+        # Basic info
+        basic_info = [
+            f"**Server:** {character['Server']} ({character['DC']})",
+            f"**Race/Clan:** {character['Race']['Name']} {character['Tribe']['Name']}",
+            f"**Gender:** {'♂' if character['Gender'] == 1 else '♀'}"
+        ]
+        
+        # Add title if available
+        title = character.get("Title")
+        if title:
+            basic_info.append(f"**Title:** {title['Name']}")
+        
+        fields = [EmbedField(name="Character Info", value="\n".join(basic_info), inline=False)]
+        
+        # Add Free Company if available
+        fc = character_data.get("FreeCompany")
+        if fc:
+            fields.append(EmbedField(
+                name="Free Company",
+                value=f"**{fc['Name']}** «{fc['Tag']}»\n{fc.get('Server', '')}\n{fc.get('Rank', '')} members",
+                inline=True
+            ))
+        
+        # Job levels (if available)
+        if "ClassJobs" in character:
+            # Group by role
+            roles = {role: [] for role in ROLE_FIELDS}
+            
+            for job in character["ClassJobs"]:
+                name = job["UnlockedState"]["Name"]
+                level = job["Level"]
                 
-                # Add fields for each role that has jobs
-                if tanks:
-                    embed.add_field(name="Tanks", value=", ".join(tanks), inline=True)
-                if healers:
-                    embed.add_field(name="Healers", value=", ".join(healers), inline=True)
-                if dps:
-                    embed.add_field(name="DPS", value=", ".join(dps), inline=True)
+                if level == 0:
+                    continue
                 
-                # Add crafters and gatherers
-                if crafters:
-                    embed.add_field(name="Crafters", value=", ".join(crafters), inline=True)
-                if gatherers:
-                    embed.add_field(name="Gatherers", value=", ".join(gatherers), inline=True)
+                roles[ROLE_OF.get(name, "DPS")].append((name, level))
             
-            # Add collection counts if available
-            if "Minions" in character_data and "Mounts" in character_data:
-                embed.add_field(
-                    name="Collections",
-                    value=f"**Minions:** {len(character_data['Minions'])}\n**Mounts:** {len(character_data['Mounts'])}",
+            # Add fields for each role that has jobs
+            fields.extend(
+                EmbedField(
+                    name=role,
+                    value=", ".join(f"{name}: {level}" for name, level in jobs),
                     inline=True
                 )
-            
-            # Add Lodestone link
-            embed.add_field(
-                name="Lodestone Link",
-                value=f"[View on Lodestone](https://na.finalfantasyxiv.com/lodestone/character/{lodestone_id}/)",
-                inline=False
-            )
-            
-            # Set footer with Lodestone ID
-            embed.set_footer(text=f"Lodestone ID: {lodestone_id}")
-            
-            # Add buttons for additional options
-            components = ActionRow(
-                Button(
-                    style=ButtonStyle.LINK,
-                    label="Open Lodestone",
-                    url=f"https://na.finalfantasyxiv.com/lodestone/character/{lodestone_id}/"
-                ),
-                Button(
-                    style=ButtonStyle.PRIMARY,
-                    label="View Collection",
-                    custom_id=f"view_collections:{lodestone_id}"
-                )
+                for role, jobs in roles.items()
+                if jobs
             )
-            
-            await ctx.send(embed=embed, components=components)
-            
-        except Exception as e:
-            logger.error(f"Error showing character details: {e}")
-            
-            embed = Embed(
-                title="Error",
-                description="An error occurred while fetching character details. Please try again later.",
-                color=0xe74c3c
+        
+        # Add collection counts if available
+        if "Minions" in character_data and "Mounts" in character_data:
+            fields.append(EmbedField(
+                name="Collections",
+                value=f"**Minions:** {len(character_data['Minions'])}\n**Mounts:** {len(character_data['Mounts'])}",
+                inline=True
+            ))
+        
+        # Add Lodestone link
+        lodestone_url = LODESTONE_URL.format(lodestone_id)
+        fields.append(EmbedField(name="Lodestone Link", value=f"[View on Lodestone]({lodestone_url})", inline=False))
+        
+        # Footer with Lodestone ID
+        footer = f"Lodestone ID: {lodestone_id}"
+        notice = _stale_notice(character_data)
+        if notice:
+            footer += f" • {notice}"
+        
+        embed = Embed(
+            title=character["Name"],
+            description=f"Level {active_job['Level']} {active_job['UnlockedState']['Name']}",
+            color=INFO_COLOR,
+            thumbnail=character["Avatar"],
+            fields=fields,
+            footer=EmbedFooter(text=footer)
+        )
+        
+        # Add buttons for additional options
+        components = ActionRow(
+            _lodestone_button(lodestone_id),
+            Button(
+                style=ButtonStyle.PRIMARY,
+                label="View Collection",
+                custom_id=f"view_collections:{lodestone_id}"
             )
-            
-            await ctx.send(embed=embed)
+        )
+        
+        await ctx.send(embed=embed, components=components)
+    
+    @component_callback(COMPONENT_ID_PATTERN)
+    @reject_when_busy
+    async def component_dispatch(self, ctx: ComponentContext):
+        """Route a button press to the handler for its custom ID action."""
+        action, _, lodestone_id = ctx.custom_id.partition(":")
+        await self.component_handlers[action](ctx, lodestone_id)
     
-    @component_callback("view_character")
-    async def view_character_callback(self, ctx: ComponentContext):
+    @handle_errors("fetching character details", edit=True)
+    async def view_character_callback(self, ctx: ComponentContext, lodestone_id: str):
         """Handle character selection."""
-        # Extract lodestone ID from custom ID
-        lodestone_id = ctx.custom_id.split(":")[-1]
-        
         # Defer response while we process
         await ctx.defer(edit_origin=True)
         
-        try:
-            await self._show_character_details(ctx, lodestone_id)
-        except Exception as e:
-            logger.error(f"Error handling character selection: {e}")
-            
-            embed = Embed(
-                title="Error",
-                description="An error occurred while fetching character details. Please try again later.",
-                color=0xe74c3c
-            )
-            
-            await ctx.edit_origin(embed=embed, components=[])
+        await self._show_character_details(ctx, lodestone_id)
     
-    @component_callback("view_collections")
-    async def view_collections_callback(self, ctx: ComponentContext):
+    @handle_errors("fetching collections", edit=True)
+    async def view_collections_callback(self, ctx: ComponentContext, lodestone_id: str):
         """Handle viewing character collections."""
-        # Extract lodestone ID from custom ID
-        lodestone_id = ctx.custom_id.split(":")[-1]
-        
         # Defer response while we process
         await ctx.defer(edit_origin=True)
         
-        try:
-            # Get detailed character information
-            character_data = await self.xivapi.get_character(lodestone_id, extended=True)
-            
-            # Check for errors
-            if "Error" in character_data:
-                embed = Embed(
-                    title="API Error",
-                    description=f"Error fetching character collections: {character_data['Error']}",
-                    color=0xe74c3c
-                )
-                return await ctx.edit_origin(embed=embed, components=[])
-            
-            # Create collections embed
-            embed = Embed(
-                title=f"{character_data['Character']['Name']}'s Collections",
-                description=f"Collection information for {character_data['Character']['Name']} from {character_data['Character']['Server']}",
-                color=0x3498db
-            )
-            
-            # Set thumbnail to character avatar
-            embed.set_thumbnail(url=character_data['Character']['Avatar'])
-            
-            # Add mount info if available
-            if "Mounts" in character_data:
-                mount_count = len(character_data["Mounts"])
-                
-                # Get 5 random mounts to display
-                import random
-                sample_size = min(5, mount_count)
-                sample_mounts = random.sample(character_data["Mounts"], sample_size) if mount_count > 0 else []
-                
-                mount_text = f"Total Mounts: {mount_count}\n\n"
-                if sample_mounts:
-                    mount_text += "**Sample Mounts:**\n"
-                    mount_text += "\n".join([mount["Name"] for mount in sample_mounts])
-                else:
-                    mount_text += "No mounts found."
-                
-                embed.add_field(
-                    name="Mounts",
-                    value=mount_text,
-                    inline=True
-                )
-            
-            # Add minion info if available
-            if "Minions" in character_data:
-                minion_count = len(character_data["Minions"])
-                
-                # Get 5 random minions to display
-                import random
-                sample_size = min(5, minion_count)
-                sample_minions = random.sample(character_data["Minions"], sample_size) if minion_count > 0 else []
-                
-                minion_text = f"Total Minions: {minion_count}\n\n"
-                if sample_minions:
-                    minion_text += "**Sample Minions:**\n"
-                    minion_text += "\n".join([minion["Name"] for minion in sample_minions])
-                else:
-                    minion_text += "No minions found."
-                
-                embed.add_field(
-                    name="Minions",
-                    value=minion_text,
-                    inline=True
-                )
-            
-            # Add back button
-            components = ActionRow(
-                Button(
-                    style=ButtonStyle.SECONDARY,
-                    label="Back to Character",
-                    custom_id=f"view_character:{lodestone_id}"
-                ),
-                Button(
-                    style=ButtonStyle.LINK,
-                    label="Open Lodestone",
-                    url=f"https://na.finalfantasyxiv.com/lodestone/character/{lodestone_id}/"
-                )
-            )
-            
-            await ctx.edit_origin(embed=embed, components=components)
-            
-        except Exception as e:
-            logger.error(f"Error showing collections: {e}")
-            
-            embed = Embed(
-                title="Error",
-                description="An error occurred while fetching collections. Please try again later.",
-                color=0xe74c3c
-            )
-            
-            await ctx.edit_origin(embed=embed, components=[])
-
-# Setup function to register the extension
-async def setup(client: Client) -> Extension:
-    """Set up the character lookup extension."""
-    cog = CharacterLookupCog(client)
-    await cog.initialize()
-    return cog
\ No newline at end of file
+        # Get detailed character information
+        character_data = await self.xivapi.get_character(lodestone_id, extended=True)
+        
+        # Check for errors
+        if "Error" in character_data:
+            embed = _error_embed("API Error", f"Error fetching character collections: {character_data['Error']}")
+            return await ctx.edit_origin(embed=embed, components=[])
+        
+        character = character_data["Character"]
+        
+        # Add mount and minion info if available
+        fields = [
+            _collection_field(label, character_data[label])
+            for label in ("Mounts", "Minions")
+            if label in character_data
+        ]
+        
+        notice = _stale_notice(character_data)
+        
+        # Create collections embed
+        embed = Embed(
+            title=f"{character['Name']}'s Collections",
+            description=f"Collection information for {character['Name']} from {character['Server']}",
+            color=INFO_COLOR,
+            thumbnail=character["Avatar"],
+            fields=fields,
+            footer=EmbedFooter(text=notice) if notice else None
+        )
+        
+        # Add back button
+        components = ActionRow(
+            Button(
+                style=ButtonStyle.SECONDARY,
+                label="Back to Character",
+                custom_id=f"view_character:{lodestone_id}"
+            ),
+            _lodestone_button(lodestone_id)
+        )
+        
+        await ctx.edit_origin(embed=embed, components=components)
\ No newline at end of file
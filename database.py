@@ -1,11 +1,15 @@
 """
 Database utilities for the FFXIV Discord bot.
-Simple SQLite implementation for character storage.
+Simple SQLite implementation for character storage, using aiosqlite so
+queries don't block the event loop.
 """
 import os
+import asyncio
 import sqlite3
 import logging
-from typing import Optional, List, Dict, Any
+import aiosqlite
+from typing import Optional, List, Dict, Any, Hashable, Tuple
+from cachetools import TTLCache
 
 # Set up logger
 logger = logging.getLogger("ffxiv_bot")
@@ -13,24 +17,92 @@ logger = logging.getLogger("ffxiv_bot")
 # Database file path
 DB_PATH = "ffxiv_bot.db"
 
-def get_db_connection():
-    """Get a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # Return rows as dictionary-like objects
-    return conn
+# Short-lived caches for character reads, invalidated on every write.
+# These are per-process; a multi-shard deployment would need a shared cache.
+CACHE_MAXSIZE = 4096
+CACHE_TTL = 60
 
-def initialize_db():
+_character_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)        # id -> row
+_name_server_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)      # (name, server[, user id]) -> row
+_user_characters_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)  # user id -> rows
+_primary_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)          # user id -> row
+
+# Keys of each user's rows in the id and name/server caches, so a write can drop
+# them without scanning every entry. An index entry is renewed whenever a key is
+# added, so it never expires before the entries it lists; expired entries are
+# purged on every insert, which keeps the indexes small without a size limit.
+_character_keys_by_user = TTLCache(maxsize=float("inf"), ttl=CACHE_TTL)    # user id -> {id}
+_name_server_keys_by_user = TTLCache(maxsize=float("inf"), ttl=CACHE_TTL)  # user id -> {name/server key}
+
+def _cache_row(cache: TTLCache, keys_by_user: TTLCache, key: Hashable, row: Dict[str, Any]):
+    """Cache a character row and index its key under the row's owner."""
+    cache[key] = row
+    
+    keys = keys_by_user.get(row["discord_user_id"], set())
+    keys.add(key)
+    keys_by_user[row["discord_user_id"]] = keys
+
+def _invalidate_user(discord_user_id: str):
+    """Drop every cached read that includes one of a user's characters."""
+    _user_characters_cache.pop(discord_user_id, None)
+    _primary_cache.pop(discord_user_id, None)
+    
+    for cache, keys_by_user in ((_character_cache, _character_keys_by_user),
+                                (_name_server_cache, _name_server_keys_by_user)):
+        for key in keys_by_user.pop(discord_user_id, ()):
+            cache.pop(key, None)
+
+def clear_cache():
+    """Clear all cached character reads."""
+    for cache in (_character_cache, _name_server_cache, _user_characters_cache, _primary_cache,
+                  _character_keys_by_user, _name_server_keys_by_user):
+        cache.clear()
+
+# Shared connection, so SQLite's per-connection statement cache is reused
+# across calls instead of recompiling every query on a fresh connection
+_connection: Optional[aiosqlite.Connection] = None
+_connection_lock = asyncio.Lock()
+
+# Serializes transactions and reads on the shared connection, so a read never
+# sees (and caches) rows from a write that hasn't committed yet
+_db_lock = asyncio.Lock()
+
+async def get_db_connection() -> aiosqlite.Connection:
+    """Get the shared connection to the SQLite database, opening it on first use."""
+    global _connection
+    
+    async with _connection_lock:
+        if _connection is None:
+            _connection = await aiosqlite.connect(DB_PATH)
+            _connection.row_factory = aiosqlite.Row  # Return rows as dictionary-like objects
+            
+            # SQLite leaves foreign keys off by default; enable them so deleting a
+            # character cascades to its MSQ progress in the same statement
+            await _connection.execute("PRAGMA foreign_keys = ON")
+    
+    return _connection
+
+async def close_db():
+    """Close the shared database connection."""
+    global _connection
+    
+    async with _connection_lock:
+        if _connection is not None:
+            await _connection.close()
+            _connection = None
+
+async def initialize_db():
     """Create necessary tables if they don't exist."""
     logger.info("Initializing database...")
     
     # Create directory if it doesn't exist
     os.makedirs(os.path.dirname(DB_PATH) if os.path.dirname(DB_PATH) else '.', exist_ok=True)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
     
     # Create characters table
-    cursor.execute('''
+    await cursor.execute('''
     CREATE TABLE IF NOT EXISTS characters (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
@@ -46,7 +118,7 @@ def initialize_db():
     ''')
     
     # Create MSQ progress table
-    cursor.execute('''
+    await cursor.execute('''
     CREATE TABLE IF NOT EXISTS msq_progress (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         character_id INTEGER NOT NULL,
@@ -59,17 +131,21 @@ def initialize_db():
     ''')
     
     # Create indices for faster lookups
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_discord_id ON characters (discord_user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_name_server ON characters (name, server)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_lodestone ON characters (lodestone_id)')
+    # The user index is ordered like the character list so it's read without a sort;
+    # it also covers lookups by user alone, replacing the old single-column index
+    await cursor.execute('DROP INDEX IF EXISTS idx_character_discord_id')
+    await cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_user_primary_name ON characters (discord_user_id, is_primary DESC, name ASC)')
+    # Name and server lookups compare case-insensitively, so the index uses the same collation
+    await cursor.execute('DROP INDEX IF EXISTS idx_character_name_server')
+    await cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_name_server_nocase ON characters (name COLLATE NOCASE, server COLLATE NOCASE)')
+    await cursor.execute('CREATE INDEX IF NOT EXISTS idx_character_lodestone ON characters (lodestone_id)')
     
-    conn.commit()
-    conn.close()
+    await conn.commit()
     
     logger.info("Database initialization complete")
 
-def add_character(discord_user_id: str, name: str, server: str, 
-                  lodestone_id: Optional[str] = None, is_primary: bool = False) -> int:
+async def add_character(discord_user_id: str, name: str, server: str, 
+                        lodestone_id: Optional[str] = None, is_primary: bool = False) -> int:
     """
     Add a new character to the database.
     
@@ -83,34 +159,94 @@ def add_character(discord_user_id: str, name: str, server: str,
     Returns:
         The ID of the newly created character
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # If this is set as primary, un-set any existing primary characters for this user
-        if is_primary:
-            cursor.execute(
-                "UPDATE characters SET is_primary = 0 WHERE discord_user_id = ?",
-                (discord_user_id,)
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        try:
+            # If this is set as primary, un-set any existing primary characters for this user
+            if is_primary:
+                await cursor.execute(
+                    "UPDATE characters SET is_primary = 0 WHERE discord_user_id = ?",
+                    (discord_user_id,)
+                )
+            
+            # Insert the new character
+            await cursor.execute(
+                "INSERT INTO characters (discord_user_id, name, server, lodestone_id, is_primary) VALUES (?, ?, ?, ?, ?)",
+                (discord_user_id, name, server, lodestone_id, is_primary)
             )
+            
+            char_id = cursor.lastrowid
+            await conn.commit()
+            _invalidate_user(discord_user_id)
+            return char_id
+        except sqlite3.Error:
+            logger.exception("Database error adding character")
+            await conn.rollback()
+            raise
+
+async def register_character(discord_user_id: str, name: str, server: str,
+                             lodestone_id: Optional[str] = None,
+                             is_primary: bool = False) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+    """
+    Register a character unless one with the same name and server already exists.
+    
+    The existence check, insert and primary decision happen in a single
+    statement. The character becomes primary if requested, or automatically
+    if it's the user's first character.
+    
+    Args:
+        discord_user_id: Discord user ID of the character owner
+        name: Character name
+        server: Character server
+        lodestone_id: Optional Lodestone ID
+        is_primary: Whether this should be the user's primary character
         
-        # Insert the new character
-        cursor.execute(
-            "INSERT INTO characters (discord_user_id, name, server, lodestone_id, is_primary) VALUES (?, ?, ?, ?, ?)",
-            (discord_user_id, name, server, lodestone_id, is_primary)
-        )
-        
-        char_id = cursor.lastrowid
-        conn.commit()
-        return char_id
-    except sqlite3.Error as e:
-        logger.error(f"Database error adding character: {e}")
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+    Returns:
+        (new character ID, None) if registered, or (None, existing character) if
+        the character was already registered
+    """
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        try:
+            await cursor.execute(
+                """
+                INSERT INTO characters (discord_user_id, name, server, lodestone_id, is_primary)
+                SELECT ?, ?, ?, ?, (? OR NOT EXISTS (SELECT 1 FROM characters WHERE discord_user_id = ?))
+                WHERE NOT EXISTS (SELECT 1 FROM characters WHERE name = ? COLLATE NOCASE AND server = ? COLLATE NOCASE)
+                """,
+                (discord_user_id, name, server, lodestone_id, is_primary, discord_user_id, name, server)
+            )
+            
+            if cursor.rowcount == 0:
+                await conn.rollback()
+                char_id = None
+            else:
+                char_id = cursor.lastrowid
+                
+                # An explicit primary replaces the user's previous one
+                if is_primary:
+                    await cursor.execute(
+                        "UPDATE characters SET is_primary = 0 WHERE discord_user_id = ? AND id != ?",
+                        (discord_user_id, char_id)
+                    )
+                
+                await conn.commit()
+                _invalidate_user(discord_user_id)
+        except sqlite3.Error:
+            logger.exception("Database error registering character")
+            await conn.rollback()
+            raise
+    
+    # Look up the existing character once the lock is released, since reads take it too
+    if char_id is None:
+        return None, await get_character_by_name_server(name, server)
+    return char_id, None
 
-def get_character(character_id: int) -> Optional[Dict[str, Any]]:
+async def get_character(character_id: int) -> Optional[Dict[str, Any]]:
     """
     Get a character by ID.
     
@@ -120,22 +256,27 @@ def get_character(character_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Character data as a dictionary, or None if not found
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cached = _character_cache.get(character_id)
+    if cached is not None:
+        return dict(cached)
     
-    cursor.execute(
-        "SELECT * FROM characters WHERE id = ?",
-        (character_id,)
-    )
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
     
-    result = cursor.fetchone()
-    conn.close()
+    async with _db_lock:
+        await cursor.execute(
+            "SELECT * FROM characters WHERE id = ?",
+            (character_id,)
+        )
+        
+        result = await cursor.fetchone()
     
     if result:
+        _cache_row(_character_cache, _character_keys_by_user, character_id, dict(result))
         return dict(result)
     return None
 
-def get_character_by_name_server(name: str, server: str) -> Optional[Dict[str, Any]]:
+async def get_character_by_name_server(name: str, server: str) -> Optional[Dict[str, Any]]:
     """
     Get a character by name and server.
     
@@ -146,22 +287,63 @@ def get_character_by_name_server(name: str, server: str) -> Optional[Dict[str, A
     Returns:
         Character data as a dictionary, or None if not found
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Names and servers match case-insensitively, so the cache key does too
+    cache_key = (name.lower(), server.lower())
+    cached = _name_server_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+    
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        await cursor.execute(
+            "SELECT * FROM characters WHERE name = ? COLLATE NOCASE AND server = ? COLLATE NOCASE",
+            (name, server)
+        )
+        
+        result = await cursor.fetchone()
     
-    cursor.execute(
-        "SELECT * FROM characters WHERE name LIKE ? AND server LIKE ?",
-        (name, server)
-    )
+    if result:
+        _cache_row(_name_server_cache, _name_server_keys_by_user, cache_key, dict(result))
+        return dict(result)
+    return None
+
+async def get_character_by_name_server_for_user(name: str, server: str,
+                                                discord_user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get a character by name and server, only if it belongs to a Discord user.
     
-    result = cursor.fetchone()
-    conn.close()
+    Args:
+        name: Character name
+        server: Character server
+        discord_user_id: Discord user ID of the character owner
+        
+    Returns:
+        Character data as a dictionary, or None if not found or owned by someone else
+    """
+    cache_key = (name.lower(), server.lower(), discord_user_id)
+    cached = _name_server_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+    
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        await cursor.execute(
+            "SELECT * FROM characters WHERE name = ? COLLATE NOCASE AND server = ? COLLATE NOCASE AND discord_user_id = ?",
+            (name, server, discord_user_id)
+        )
+        
+        result = await cursor.fetchone()
     
     if result:
+        _cache_row(_name_server_cache, _name_server_keys_by_user, cache_key, dict(result))
         return dict(result)
     return None
 
-def get_user_characters(discord_user_id: str) -> List[Dict[str, Any]]:
+async def get_user_characters(discord_user_id: str) -> List[Dict[str, Any]]:
     """
     Get all characters for a Discord user.
     
@@ -171,20 +353,25 @@ def get_user_characters(discord_user_id: str) -> List[Dict[str, Any]]:
     Returns:
         List of character dictionaries
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cached = _user_characters_cache.get(discord_user_id)
+    if cached is not None:
+        return [dict(row) for row in cached]
     
-    cursor.execute(
-        "SELECT * FROM characters WHERE discord_user_id = ? ORDER BY is_primary DESC, name ASC",
-        (discord_user_id,)
-    )
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
     
-    results = cursor.fetchall()
-    conn.close()
+    async with _db_lock:
+        await cursor.execute(
+            "SELECT * FROM characters WHERE discord_user_id = ? ORDER BY is_primary DESC, name ASC",
+            (discord_user_id,)
+        )
+        
+        results = await cursor.fetchall()
     
+    _user_characters_cache[discord_user_id] = [dict(row) for row in results]
     return [dict(row) for row in results]
 
-def get_primary_character(discord_user_id: str) -> Optional[Dict[str, Any]]:
+async def get_primary_character(discord_user_id: str) -> Optional[Dict[str, Any]]:
     """
     Get a user's primary character.
     
@@ -194,22 +381,27 @@ def get_primary_character(discord_user_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         Primary character data as a dictionary, or None if not found
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    cached = _primary_cache.get(discord_user_id)
+    if cached is not None:
+        return dict(cached)
     
-    cursor.execute(
-        "SELECT * FROM characters WHERE discord_user_id = ? AND is_primary = 1",
-        (discord_user_id,)
-    )
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
     
-    result = cursor.fetchone()
-    conn.close()
+    async with _db_lock:
+        await cursor.execute(
+            "SELECT * FROM characters WHERE discord_user_id = ? AND is_primary = 1",
+            (discord_user_id,)
+        )
+        
+        result = await cursor.fetchone()
     
     if result:
+        _primary_cache[discord_user_id] = dict(result)
         return dict(result)
     return None
 
-def set_primary_character(character_id: int, discord_user_id: str) -> bool:
+async def set_primary_character(character_id: int, discord_user_id: str) -> bool:
     """
     Set a character as the primary character for a user.
     
@@ -220,41 +412,36 @@ def set_primary_character(character_id: int, discord_user_id: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Verify the character belongs to the user
-        cursor.execute(
-            "SELECT id FROM characters WHERE id = ? AND discord_user_id = ?",
-            (character_id, discord_user_id)
-        )
-        if not cursor.fetchone():
-            logger.warning(f"User {discord_user_id} tried to set primary character {character_id} they don't own")
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        try:
+            # Move the primary flag in one statement, which only touches the user's
+            # characters if they own the requested one
+            await cursor.execute(
+                """
+                UPDATE characters SET is_primary = (id = ?)
+                WHERE discord_user_id = ?
+                AND EXISTS (SELECT 1 FROM characters WHERE id = ? AND discord_user_id = ?)
+                """,
+                (character_id, discord_user_id, character_id, discord_user_id)
+            )
+            if cursor.rowcount == 0:
+                logger.warning("User %s tried to set primary character %s that doesn't exist or they don't own",
+                               discord_user_id, character_id)
+                await conn.rollback()
+                return False
+            
+            await conn.commit()
+            _invalidate_user(discord_user_id)
+            return True
+        except sqlite3.Error:
+            logger.exception("Database error setting primary character")
+            await conn.rollback()
             return False
-        
-        # Clear existing primary
-        cursor.execute(
-            "UPDATE characters SET is_primary = 0 WHERE discord_user_id = ?",
-            (discord_user_id,)
-        )
-        
-        # Set new primary
-        cursor.execute(
-            "UPDATE characters SET is_primary = 1 WHERE id = ?",
-            (character_id,)
-        )
-        
-        conn.commit()
-        return True
-    except sqlite3.Error as e:
-        logger.error(f"Database error setting primary character: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
 
-def mark_character_verified(character_id: int, lodestone_id: str = None) -> bool:
+async def mark_character_verified(character_id: int, lodestone_id: str = None) -> bool:
     """
     Mark a character as verified.
     
@@ -265,31 +452,36 @@ def mark_character_verified(character_id: int, lodestone_id: str = None) -> bool
     Returns:
         True if successful, False otherwise
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        if lodestone_id:
-            cursor.execute(
-                "UPDATE characters SET verified = 1, lodestone_id = ? WHERE id = ?",
-                (lodestone_id, character_id)
-            )
-        else:
-            cursor.execute(
-                "UPDATE characters SET verified = 1 WHERE id = ?",
-                (character_id,)
-            )
-        
-        conn.commit()
-        return cursor.rowcount > 0
-    except sqlite3.Error as e:
-        logger.error(f"Database error marking character as verified: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        try:
+            # Return the owner so only their cached reads need dropping
+            if lodestone_id:
+                await cursor.execute(
+                    "UPDATE characters SET verified = 1, lodestone_id = ? WHERE id = ? RETURNING discord_user_id",
+                    (lodestone_id, character_id)
+                )
+            else:
+                await cursor.execute(
+                    "UPDATE characters SET verified = 1 WHERE id = ? RETURNING discord_user_id",
+                    (character_id,)
+                )
+            result = await cursor.fetchone()
+            
+            await conn.commit()
+            if result is None:
+                return False
+            
+            _invalidate_user(result["discord_user_id"])
+            return True
+        except sqlite3.Error:
+            logger.exception("Database error marking character as verified")
+            await conn.rollback()
+            return False
 
-def update_character_job(character_id: int, job: str, level: int) -> bool:
+async def update_character_job(character_id: int, job: str, level: int) -> bool:
     """
     Update a character's active job and level.
     
@@ -301,25 +493,30 @@ def update_character_job(character_id: int, job: str, level: int) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(
-            "UPDATE characters SET active_job = ?, job_level = ? WHERE id = ?",
-            (job, level, character_id)
-        )
-        
-        conn.commit()
-        return cursor.rowcount > 0
-    except sqlite3.Error as e:
-        logger.error(f"Database error updating character job: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        try:
+            # Return the owner so only their cached reads need dropping
+            await cursor.execute(
+                "UPDATE characters SET active_job = ?, job_level = ? WHERE id = ? RETURNING discord_user_id",
+                (job, level, character_id)
+            )
+            result = await cursor.fetchone()
+            
+            await conn.commit()
+            if result is None:
+                return False
+            
+            _invalidate_user(result["discord_user_id"])
+            return True
+        except sqlite3.Error:
+            logger.exception("Database error updating character job")
+            await conn.rollback()
+            return False
 
-def remove_character(character_id: int, discord_user_id: str) -> bool:
+async def remove_character(character_id: int, discord_user_id: str) -> bool:
     """
     Remove a character from the database.
     
@@ -330,30 +527,26 @@ def remove_character(character_id: int, discord_user_id: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Verify the character belongs to the user
-        cursor.execute(
-            "SELECT id FROM characters WHERE id = ? AND discord_user_id = ?",
-            (character_id, discord_user_id)
-        )
-        if not cursor.fetchone():
-            logger.warning(f"User {discord_user_id} tried to remove character {character_id} they don't own")
-            return False
-        
-        # Delete the character (cascade will remove related records)
-        cursor.execute(
-            "DELETE FROM characters WHERE id = ?",
-            (character_id,)
-        )
-        
-        conn.commit()
-        return cursor.rowcount > 0
-    except sqlite3.Error as e:
-        logger.error(f"Database error removing character: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
\ No newline at end of file
+    conn = await get_db_connection()
+    cursor = await conn.cursor()
+    
+    async with _db_lock:
+        try:
+            # Delete the character only if the user owns it (cascade will remove related records)
+            await cursor.execute(
+                "DELETE FROM characters WHERE id = ? AND discord_user_id = ?",
+                (character_id, discord_user_id)
+            )
+            if cursor.rowcount == 0:
+                logger.warning("User %s tried to remove character %s that doesn't exist or they don't own",
+                               discord_user_id, character_id)
+                await conn.rollback()
+                return False
+            
+            await conn.commit()
+            _invalidate_user(discord_user_id)
+            return True
+        except sqlite3.Error:
+            logger.exception("Database error removing character")
+            await conn.rollback()
+            return False
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Rate limiting utilities for the FFXIV Discord bot.
+"""
+import asyncio
+import time
+from typing import Hashable
+
+from cachetools import TTLCache
+
+class AsyncTokenBucket:
+    """Token bucket rate limiter for outbound API requests."""
+    
+    def __init__(self, rate_per_sec: float, capacity: float):
+        """
+        Initialize the token bucket.
+        
+        Args:
+            rate_per_sec: Number of tokens added to the bucket per second
+            capacity: Maximum number of tokens the bucket can hold (burst size)
+        """
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        """Add the tokens accumulated since the last update."""
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_sec)
+        self.last_update = now
+    
+    async def acquire(self, tokens: float = 1):
+        """
+        Wait until enough tokens are available, then take them.
+        
+        Args:
+            tokens: Number of tokens to take
+        """
+        # Hold the lock while waiting so callers are served in order
+        async with self._lock:
+            self._refill()
+            
+            if self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate_per_sec)
+                self._refill()
+            
+            self.tokens -= tokens
+
+class Cooldown:
+    """Per-key cooldown allowing one call per interval, such as one command per user."""
+    
+    def __init__(self, interval: float, maxsize: int = 10000):
+        """
+        Initialize the cooldown.
+        
+        Args:
+            interval: Minimum number of seconds between calls for the same key
+            maxsize: Maximum number of keys tracked at once
+        """
+        self.interval = interval
+        
+        # Last call time per key; entries expire once their cooldown has passed
+        self._last_used = TTLCache(maxsize=maxsize, ttl=interval)
+    
+    def retry_after(self, key: Hashable) -> float:
+        """
+        Record a call for a key if it's off cooldown.
+        
+        Args:
+            key: Key to check, such as a user ID
+            
+        Returns:
+            0 if the call is allowed, otherwise seconds until it will be
+        """
+        now = time.monotonic()
+        
+        last_used = self._last_used.get(key)
+        if last_used is not None and now - last_used < self.interval:
+            return self.interval - (now - last_used)
+        
+        self._last_used[key] = now
+        return 0.0
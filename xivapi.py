@@ -1,18 +1,64 @@
 """
 XIVAPI Client for the FFXIV Discord bot.
 """
+import asyncio
 import logging
 import aiohttp
+import orjson
 import os
+import time
 from typing import Dict, List, Optional, Any, Union
+from urllib.parse import urlencode
+from cachetools import TLRUCache
 from dotenv import load_dotenv
 
+from ratelimit import AsyncTokenBucket
+
 # Load environment variables
 load_dotenv()
 
 # Configure logger
 logger = logging.getLogger("ffxiv_bot")
 
+# Cache lifetimes for XIVAPI responses (in seconds)
+CACHE_TTL_SEARCH = 60            # Character search results
+CACHE_TTL_PROFILE = 10 * 60      # Character profiles
+CACHE_TTL_STATIC = 24 * 60 * 60  # Static data such as servers and data centers
+
+# XIVAPI allows 20 requests per second per key
+RATE_LIMIT_PER_SEC = 20
+
+# Connection pool and timeouts for the shared HTTP session
+MAX_CONNECTIONS = 50
+MAX_CONNECTIONS_PER_HOST = 20
+DNS_CACHE_TTL = 5 * 60
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3)
+
+# How long stale responses are kept to fall back on when XIVAPI is unreachable
+CACHE_STALE_GRACE = 24 * 60 * 60
+
+def _cache_expiry(key, value, now):
+    """Return when a cached (stored_at, fresh_until, response) entry should be evicted."""
+    return value[1] + CACHE_STALE_GRACE
+
+def _is_upstream_failure(response: Any) -> bool:
+    """Check whether a response is an outage-type error rather than a real API answer."""
+    if not isinstance(response, dict) or "Error" not in response:
+        return False
+    status = response.get("status", 0)
+    return status == 0 or status == 429 or status >= 500
+
+def _cache_key(endpoint: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build the cache key for a request, before the API key is added.
+    
+    Parameter values are case-folded in the key only, so lookups that differ
+    just in letter case share an entry while XIVAPI still gets the values
+    exactly as the caller passed them.
+    """
+    items = sorted((key, str(value).casefold()) for key, value in (params or {}).items())
+    return f"{endpoint}?{urlencode(items)}"
+
 class XIVAPIClient:
     """Client for interacting with XIVAPI."""
     
@@ -27,22 +73,129 @@ class XIVAPIClient:
         """
         self.api_key = api_key or os.getenv("XIVAPI_KEY")
         self.session = None
+        
+        # Throttle requests to stay under XIVAPI's rate limit
+        self.rate_limiter = AsyncTokenBucket(RATE_LIMIT_PER_SEC, RATE_LIMIT_PER_SEC)
+        
+        # Successful responses keyed by endpoint and query, as (stored_at, fresh_until, response)
+        self._cache = TLRUCache(maxsize=1024, ttu=_cache_expiry)
+        
+        # Fetches in progress keyed like the cache, so concurrent identical
+        # requests share a single call to XIVAPI
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def initialize(self):
         """Initialize HTTP session for API requests."""
         if self.session is None or self.session.closed:
+            # Keep-alive connections are pooled across requests, so only the
+            # first request to XIVAPI pays for the TCP and TLS handshakes
+            connector = aiohttp.TCPConnector(
+                limit=MAX_CONNECTIONS,
+                limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=DNS_CACHE_TTL
+            )
             self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=REQUEST_TIMEOUT,
                 headers={"User-Agent": "FFXIV Discord Bot/1.0"}
             )
     
-    async def close(self):
-        """Close the HTTP session."""
+    async def close(self, timeout: float = 5.0):
+        """
+        Close the HTTP session.
+        
+        Args:
+            timeout: Seconds to wait for in-flight connections to close
+        """
         if self.session and not self.session.closed:
-            await self.session.close()
+            try:
+                await asyncio.wait_for(self.session.close(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out closing XIVAPI session after %ss", timeout)
+    
+    async def _request(self, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                       ttl: Optional[int] = None, tag_stale: bool = False) -> Dict[str, Any]:
+        """
+        Make a request to XIVAPI, serving it from the cache when possible.
+        
+        Responses past their freshness window are refetched, but if XIVAPI is
+        unreachable the stale copy is returned instead. With tag_stale, a stale
+        copy also gets a "CacheAge" key giving its age in seconds. Concurrent
+        requests for the same uncached response share one fetch.
+        
+        Args:
+            endpoint: API endpoint to request
+            params: Query parameters
+            ttl: Seconds to cache a successful response for, or None to skip caching
+            tag_stale: Whether to add "CacheAge" to a stale response; only use this for
+                endpoints whose responses are records rather than keyed mappings
+            
+        Returns:
+            API response as JSON
+        """
+        if not ttl:
+            return await self._fetch(endpoint, params)
+        
+        # The key is built before the API key is added so it never ends up in the cache
+        cache_key = _cache_key(endpoint, params)
+        
+        cached = self._cache.get(cache_key)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[2]
+        
+        # Join a fetch that's already running for the same request
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(cache_key, endpoint, params, ttl, cached, tag_stale))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        
+        # Shielded so one caller being cancelled doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+    
+    async def _refresh(self, cache_key: str, endpoint: str, params: Optional[Dict[str, Any]],
+                       ttl: int, cached: Optional[tuple], tag_stale: bool = False) -> Dict[str, Any]:
+        """
+        Fetch a response and store it in the cache.
+        
+        Args:
+            cache_key: Cache key for the request
+            endpoint: API endpoint to request
+            params: Query parameters
+            ttl: Seconds to cache a successful response for
+            cached: The stale cache entry, if any, to fall back on when XIVAPI is down
+            tag_stale: Whether to add "CacheAge" to a stale response
+            
+        Returns:
+            API response as JSON
+        """
+        response = await self._fetch(endpoint, params)
+        
+        if isinstance(response, dict) and "Error" in response:
+            # Fall back to the stale copy while XIVAPI is down
+            if cached is not None and _is_upstream_failure(response):
+                stored_at, _, stale = cached
+                logger.warning("Serving stale XIVAPI response for %s: %s", endpoint, response["Error"])
+                if tag_stale and isinstance(stale, dict):
+                    return {**stale, "CacheAge": time.monotonic() - stored_at}
+                return stale
+            
+            # Don't cache errors so the next request retries the API
+            return response
+        
+        now = time.monotonic()
+        self._cache[cache_key] = (now, now + ttl, response)
+        
+        return response
+    
+    def _is_fresh(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Check whether a request can be answered from the cache without a round trip."""
+        cached = self._cache.get(_cache_key(endpoint, params))
+        return cached is not None and time.monotonic() < cached[1]
     
-    async def _request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def _fetch(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        Make a request to XIVAPI.
+        Make an uncached request to XIVAPI.
         
         Args:
             endpoint: API endpoint to request
@@ -56,12 +209,13 @@ class XIVAPIClient:
         url = f"{self.BASE_URL}/{endpoint}"
         
         # Add API key if available
-        if params is None:
-            params = {}
+        params = dict(params) if params else {}
         
         if self.api_key:
             params["private_key"] = self.api_key
         
+        await self.rate_limiter.acquire()
+        
         try:
             async with self.session.get(url, params=params) as response:
                 if response.status == 429:
@@ -70,18 +224,22 @@ class XIVAPIClient:
                     return {"Error": "Rate limited by XIVAPI", "status": 429}
                 
                 response.raise_for_status()
-                return await response.json()
+                return orjson.loads(await response.read())
                 
         except aiohttp.ClientResponseError as e:
-            logger.error(f"HTTP error accessing XIVAPI: {e.status} {e.message}")
+            logger.error("HTTP error accessing XIVAPI: %s %s", e.status, e.message)
             return {"Error": f"HTTP error: {e.status} {e.message}", "status": e.status}
             
         except aiohttp.ClientError as e:
-            logger.error(f"Error accessing XIVAPI: {e}")
+            logger.error("Error accessing XIVAPI: %s", e)
             return {"Error": f"Connection error: {str(e)}", "status": 0}
             
+        except asyncio.TimeoutError:
+            logger.error("Timed out accessing XIVAPI: %s", endpoint)
+            return {"Error": "Request to XIVAPI timed out", "status": 0}
+            
         except Exception as e:
-            logger.error(f"Unexpected error accessing XIVAPI: {e}")
+            logger.exception("Unexpected error accessing XIVAPI")
             return {"Error": f"Unexpected error: {str(e)}", "status": 0}
     
     async def search_character(self, name: str, server: Optional[str] = None) -> Dict[str, Any]:
@@ -95,12 +253,32 @@ class XIVAPIClient:
         Returns:
             Search results
         """
-        params = {"name": name}
+        return await self._request("character/search", self._search_params(name, server),
+                                   ttl=CACHE_TTL_SEARCH, tag_stale=True)
+    
+    def has_character_search(self, name: str, server: Optional[str] = None) -> bool:
+        """
+        Check whether a character search is cached and still fresh.
+        
+        Args:
+            name: Character name
+            server: Optional server name
+            
+        Returns:
+            True if search_character would return without calling XIVAPI
+        """
+        return self._is_fresh("character/search", self._search_params(name, server))
+    
+    @staticmethod
+    def _search_params(name: str, server: Optional[str] = None) -> Dict[str, Any]:
+        """Build the query parameters for a character search."""
+        params = {"name": " ".join(name.split())}
         
+        # XIVAPI matches the server name case-sensitively
         if server:
-            params["server"] = server
+            params["server"] = server.strip().title()
         
-        return await self._request("character/search", params)
+        return params
     
     async def get_character(self, lodestone_id: str, extended: bool = False) -> Dict[str, Any]:
         """
@@ -113,12 +291,16 @@ class XIVAPIClient:
         Returns:
             Character information
         """
-        params = {
+        return await self._request(f"character/{lodestone_id}", self._character_params(extended),
+                                   ttl=CACHE_TTL_PROFILE, tag_stale=True)
+    
+    @staticmethod
+    def _character_params(extended: bool = False) -> Dict[str, Any]:
+        """Build the query parameters for a character request."""
+        return {
             "extended": 1 if extended else 0,
             "data": "FC,MIMO" if extended else ""  # FC = Free Company, MIMO = Minions & Mounts
         }
-        
-        return await self._request(f"character/{lodestone_id}", params)
     
     async def get_servers(self) -> List[str]:
         """
@@ -127,7 +309,7 @@ class XIVAPIClient:
         Returns:
             List of server names
         """
-        response = await self._request("servers")
+        response = await self._request("servers", ttl=CACHE_TTL_STATIC)
         
         if isinstance(response, list):
             return response
@@ -140,8 +322,27 @@ class XIVAPIClient:
         Returns:
             Dictionary with data centers as keys and lists of servers as values
         """
-        response = await self._request("servers/dc")
+        response = await self._request("servers/dc", ttl=CACHE_TTL_STATIC)
         
         if not isinstance(response, dict) or "Error" in response:
             return {}
-        return response
\ No newline at end of file
+        return response
+
+def get_shared_client(bot: Any) -> XIVAPIClient:
+    """
+    Get the XIVAPI client shared by all cogs, creating it on first use.
+    
+    Sharing one client means every cog uses the same HTTP connection pool,
+    response cache and rate limiter.
+    
+    Args:
+        bot: The bot client to attach the shared XIVAPI client to
+        
+    Returns:
+        The shared XIVAPI client
+    """
+    xivapi = getattr(bot, "xivapi", None)
+    if xivapi is None:
+        xivapi = XIVAPIClient()
+        bot.xivapi = xivapi
+    return xivapi